@@ -1,6 +1,8 @@
 """
 Simple Spaceship Simulation (c) 2023 Multi-Agent AI
 """
+import collections
+import concurrent.futures
 import random
 import typing
 import numpy as np
@@ -9,15 +11,26 @@ random.seed(42)
 
 h = 0.2  # time step Δt
 
+class Proposal(typing.NamedTuple):
+    """ The actions an agent proposes for one time step, see Agent.propose() and Agent.commit(). """
+    target_id: typing.Optional[int]  # id of the target to follow, None for no target
+    release: bool  # the current target is given up and its targeted counter decreased
+    shoot: bool  # fire the laser at the target
+    neighbor_ids: typing.Optional[typing.List[int]]  # new neighbor cache, None to keep the current one
+    force: np.ndarray  # all forces except the one towards the target
+
 class Agent():
     vmax = 15.0
+    target_distance = 100**2  # squared distance in which targets are found and followed
+    laser_distance = 500  # squared range of the laser, was 350
+    neighbor_distance = 10000  # squared radius of the neighbor cache
 
     @staticmethod
     def square_distance(x: np.ndarray) -> np.ndarray:
         """ Calculates and return the square of the norm of the input vector x. """
         return x.dot(x)
 
-    def __init__(self, agent_id: int, agent_type: int, x: float, y: float, z: float):
+    def __init__(self, agent_id: int, agent_type: int, x: float, y: float, z: float, energy: float=100):
         self.type = agent_type
         self.id = agent_id
 
@@ -31,7 +44,7 @@ class Agent():
         self.is_alive = True
         self.target = None
         self.targeted = 0
-        self.energy = 100
+        self.energy = energy
         self.neighbors = []
 
     def hit(self, systemtime:int, output_file: typing.TextIO, damage: float=1.0):
@@ -61,23 +74,50 @@ class Agent():
             min_distance (optional): Distance of target to be found
             max_targets (optional): That many agents can follow one target simultaneously.
         """
-        if self.target:
-            distance = Agent.square_distance(self.position - self.target.position)
-            if distance > min_distance or random.random()<0.01:
-                self.target.targeted -= 1
-                self.target = None
+        target, release = self.select_target(self.target, agents, random.random, min_distance, max_targets)
+
+        if release:
+            self.target.targeted -= 1
+            self.target = None
+
+        if target is not self.target:
+            self.target = target
+            if self.target:
+                self.target.targeted += 1
+
+    def select_target(self, target: typing.Optional['Agent'], agents: typing.List['Agent'], roll: typing.Callable[[], float],
+                      min_distance: float=np.inf, max_targets: int=8) -> typing.Tuple[typing.Optional['Agent'], bool]:
+        """
+        Decide on the target without changing any agent, the rules of find_target().
 
-        if not self.target:
+        Args:
+            target: The current target, if any.
+            agents: All agents in the simulation that can be a target
+            roll: Returns a random number in [0, 1), only called if needed.
+            min_distance (optional): Distance of target to be found
+            max_targets (optional): That many agents can follow one target simultaneously.
+
+        Returns:
+            typing.Tuple[Agent, bool]: The new target, if any, and whether the current target is given up.
+        """
+        released = None
+        if target:
+            distance = Agent.square_distance(self.position - target.position)
+            if distance > min_distance or roll()<0.01:
+                released = target
+                target = None
+
+        if not target:
             min_distance_tmp = min_distance
             for a in agents:
-                if a.type is not self.type and a.is_alive and a.targeted < max_targets:
+                targeted = a.targeted - 1 if a is released else a.targeted  # no longer followed by this agent
+                if a.type is not self.type and a.is_alive and targeted < max_targets:
                     distance = Agent.square_distance(self.position - a.position)
                     if distance < min_distance_tmp:
                         min_distance_tmp = distance
-                        self.target = a
+                        target = a
 
-            if self.target:
-                self.target.targeted += 1
+        return target, released is not None
 
     def attack(self, systemtime: int, output_file: typing.TextIO, min_distance: float=0, probability: float=0.08):
         """
@@ -89,13 +129,31 @@ class Agent():
             distance (optional): Distance, range of the laser.
             probability (optional): Probaility of firing the laser per timestep.
         """
-        if self.target:
-            distance = Agent.square_distance(self.position - self.target.position)
+        if self.select_attack(self.target, random.random, min_distance, probability):
+            print(f"{systemtime}, Shot, {self.id}, {self.target.id}", file=output_file)
+            self.target.hit(systemtime, output_file, damage=2.5)
+
+    def select_attack(self, target: typing.Optional['Agent'], roll: typing.Callable[[], float], min_distance: float=0,
+                      probability: float=0.08) -> bool:
+        """
+        Decide whether to shoot at the target without changing any agent, the rules of attack().
+
+        Args:
+            target: The current target, if any.
+            roll: Returns a random number in [0, 1), only called if needed.
+            min_distance (optional): Distance, range of the laser.
+            probability (optional): Probaility of firing the laser per timestep.
+
+        Returns:
+            bool: True if the laser is fired.
+        """
+        if target:
+            distance = Agent.square_distance(self.position - target.position)
 
             if distance < min_distance:
-                if random.random() <= probability:  # shoot not too often, reloading or sth
-                    print(f"{systemtime}, Shot, {self.id}, {self.target.id}", file=output_file)
-                    self.target.hit(systemtime, output_file, damage=2.5)
+                return roll() <= probability  # shoot not too often, reloading or sth
+
+        return False
 
     def reset_neighbor_cache(self, agents: typing.List['Agent'], min_distance: float=np.inf):
         """
@@ -105,22 +163,43 @@ class Agent():
             agents: All agents in the simulation that can affect this agent.
             min_distance (optional): Agents inside radius of min_distance are considered as neighbor.
         """
-        self.neighbors = []
+        self.neighbors = self.find_neighbors(agents, min_distance)
+
+    def find_neighbors(self, agents: typing.List['Agent'], min_distance: float=np.inf) -> typing.List['Agent']:
+        """
+        Find all agents nearby.
+
+        Args:
+            agents: All agents in the simulation that can affect this agent.
+            min_distance (optional): Agents inside radius of min_distance are considered as neighbor.
+
+        Returns:
+            typing.List[Agent]: The agents inside radius of min_distance.
+        """
+        neighbors = []
         for a in agents:
             if a is not self and a.is_alive:
                 distance = Agent.square_distance(self.position - a.position)
                 if distance < min_distance:
-                    self.neighbors.append(a)
+                    neighbors.append(a)
+
+        return neighbors
 
-    def calculate_force_social(self) -> np.ndarray:
+    def calculate_force_social(self, neighbors: typing.Optional[typing.List['Agent']]=None) -> np.ndarray:
         """
         Social interaction between agents.
 
+        Args:
+            neighbors (optional): The agents to interact with, defaults to the neighbor cache.
+
         Returns:
             np.ndarray: A vector containing the force that pushes away from other agents.
         """
+        if neighbors is None:
+            neighbors = self.neighbors
+
         force = np.array([0, 0, 0], dtype=np.float64)
-        for a in self.neighbors:
+        for a in neighbors:
             distance = np.linalg.norm(self.position - a.position)
             factor = 2 / np.exp(0.5 * 2) if distance < 2 else distance / np.exp(0.5 * distance)
             force = force + factor * (self.position - a.position)
@@ -166,7 +245,8 @@ class Agent():
 
         return np.array([0, 0, 0], dtype=np.float64)
 
-    def update(self, systemtime: int, agents: typing.List['Agent'], output_file: typing.TextIO):
+    def update(self, systemtime: int, agents: typing.List['Agent'], output_file: typing.TextIO,
+               f_social: typing.Optional[np.ndarray]=None):
         """
         Update agent's acceleration based on various forces.
 
@@ -174,6 +254,7 @@ class Agent():
             systemtime: The current time step of the simulation.
             output_file: An open file descriptor which accepts the output of the simulation.
             agents: All agents currently in the simulation.
+            f_social (optional): The social force, if already calculated for the whole fleet by SocialForce.
         """
         if not self.is_alive:
             return
@@ -182,21 +263,32 @@ class Agent():
         if self.target and (self.target not in agents or not self.target.is_alive):  # target is dead, don't chase it further
             self.target = None
 
-        self.find_target(agents, min_distance=100**2)
-        self.attack(systemtime, output_file, min_distance=500)  # was 350
+        self.find_target(agents, min_distance=Agent.target_distance)
+        self.attack(systemtime, output_file, min_distance=Agent.laser_distance)
 
-        # the neighbor cache is for faster access to agents nearby
-        if systemtime % 10 == 0:
-            self.reset_neighbor_cache(agents, min_distance=10000)
+        # the neighbor cache is for faster access to agents nearby, only needed for the social force
+        if f_social is None:
+            if systemtime % 10 == 0:
+                self.reset_neighbor_cache(agents, min_distance=Agent.neighbor_distance)
+
+            f_social = self.calculate_force_social()
 
         # calculate the forces
-        f_social = self.calculate_force_social()
         f_center = self.calculate_force_center()
         f_nofly = self.calculate_force_nofly_zone()
         f_target = self.calculate_force_target()
 
         force = 0.2 * f_social + 0.4 * f_center + 0.1 * f_nofly + 0.4 *f_target
 
+        self.apply_force(force)
+
+    def apply_force(self, force: np.ndarray):
+        """
+        Update agent's velocity based on the total force acting on it.
+
+        Args:
+            force: The sum of all forces for the current time step.
+        """
         # update direction based on the forces. Leapfrog integration (https://en.wikipedia.org/wiki/Leapfrog_integration)
         self.velocity = self.velocity + h * 0.5 * (self.force + force)
         self.force = force
@@ -206,6 +298,93 @@ class Agent():
         if velocity > (Agent.vmax * h):
             self.velocity = self.velocity / velocity * (Agent.vmax * h)
 
+    def propose(self, systemtime: int, agents: typing.List['Agent'], rolls: typing.Tuple[float, float],
+                max_targets: int=8, f_social: typing.Optional[np.ndarray]=None) -> typing.Optional[Proposal]:
+        """
+        Decide on the actions of this time step without changing any agent, the first phase of a two-phase step.
+
+        All agents propose against the same, unchanged world and commit() applies the proposals afterwards,
+        so the proposals can be calculated in any order or in parallel. The random numbers are drawn by the
+        caller, which keeps the result independent of the worker that calculates the proposal.
+
+        Args:
+            systemtime: The current time step of the simulation.
+            agents: All agents currently in the simulation.
+            rolls: Two random numbers in [0, 1), for giving up the target and for firing the laser.
+            max_targets (optional): That many agents can follow one target simultaneously.
+            f_social (optional): The social force, if already calculated for the whole fleet by SocialForce.
+
+        Returns:
+            Proposal: The proposed actions, or None if the agent is dead.
+        """
+        if not self.is_alive:
+            return None
+
+        # agents are only removed from the list once they are dead
+        target = self.target
+        if target and not target.is_alive:  # target is dead, don't chase it further
+            target = None
+
+        target, release = self.select_target(target, agents, lambda: rolls[0], Agent.target_distance, max_targets)
+        shoot = self.select_attack(target, lambda: rolls[1], Agent.laser_distance)
+
+        neighbors = None
+        if f_social is None:
+            if systemtime % 10 == 0:
+                neighbors = self.find_neighbors(agents, min_distance=Agent.neighbor_distance)
+
+            f_social = self.calculate_force_social(neighbors)
+
+        f_center = self.calculate_force_center()
+        f_nofly = self.calculate_force_nofly_zone()
+        force = 0.2 * f_social + 0.4 * f_center + 0.1 * f_nofly
+
+        return Proposal(target_id=target.id if target else None,
+                        release=release,
+                        shoot=shoot,
+                        neighbor_ids=[a.id for a in neighbors] if neighbors is not None else None,
+                        force=force)
+
+    def commit(self, systemtime: int, proposal: typing.Optional[Proposal], agents_by_id: typing.Dict[int, 'Agent'],
+               output_file: typing.TextIO, max_targets: int=8):
+        """
+        Apply the proposed actions, the second phase of a two-phase step.
+
+        Proposals are committed one agent after the other. Conflicts are resolved in that order: a new target
+        is only assigned while less than max_targets agents follow it, and agents which got destroyed earlier
+        in the commit phase neither act nor can be shot at.
+
+        Args:
+            systemtime: The current time step of the simulation.
+            proposal: The actions returned by propose().
+            agents_by_id: All agents currently in the simulation, by their id.
+            output_file: An open file descriptor which accepts the output of the simulation.
+            max_targets (optional): That many agents can follow one target simultaneously.
+        """
+        if not self.is_alive or proposal is None:
+            return
+
+        if proposal.release:
+            self.target.targeted -= 1
+            self.target = None
+
+        target = agents_by_id[proposal.target_id] if proposal.target_id is not None else None
+        if target is not self.target:
+            self.target = None
+            if target and target.is_alive and target.targeted < max_targets:
+                self.target = target
+                self.target.targeted += 1
+
+        if proposal.shoot and self.target and self.target is target and self.target.is_alive:
+            print(f"{systemtime}, Shot, {self.id}, {self.target.id}", file=output_file)
+            self.target.hit(systemtime, output_file, damage=2.5)
+
+        if proposal.neighbor_ids is not None:
+            self.neighbors = [agents_by_id[i] for i in proposal.neighbor_ids]
+
+        f_target = self.calculate_force_target()
+        self.apply_force(proposal.force + 0.4 * f_target)
+
     def move(self, systemtime: int, output_file: typing.TextIO):
         """
         Update agent's position based on acceleration.
@@ -231,9 +410,310 @@ class Agent():
             message += f"{self.force[0]}, {self.force[1]}, {self.force[2]}"
             print(message, file=output_file)
 
-def main():
+def social_force_factor(distance: np.ndarray) -> np.ndarray:
+    """
+    The falloff of the social force, the same as in Agent.calculate_force_social().
+
+    Args:
+        distance: Distances between two agents.
+
+    Returns:
+        np.ndarray: The factor for the vector between both agents.
+    """
+    return np.where(distance < 2, 2 / np.exp(0.5 * 2), distance / np.exp(0.5 * np.maximum(distance, 2)))
+
+def social_force_cutoff(epsilon: float=1e-6) -> float:
+    """
+    Distance beyond which the social force between two agents, distance² / exp(0.5 * distance), stays below epsilon.
+
+    Args:
+        epsilon (optional): The largest force of a single pair which may be neglected.
+
+    Returns:
+        float: The cutoff distance.
+    """
+    # the force is largest at a distance of 4 and decreases afterwards, bisect the falling part
+    low, high = 4.0, 4.0
+    while high ** 2 / np.exp(0.5 * high) >= epsilon:
+        high = 2 * high
+
+    for _ in range(60):
+        middle = 0.5 * (low + high)
+        if middle ** 2 / np.exp(0.5 * middle) >= epsilon:
+            low = middle
+        else:
+            high = middle
+
+    return high
+
+class SocialForce():
+    """
+    Social interaction of the whole fleet at once, a batched version of Agent.calculate_force_social().
+
+    Pairs further apart than a cutoff are neglected, the cutoff follows from the falloff of the force. The falloff is
+    looked up in a table over the squared distance, so neither a square root nor an exponential is needed per pair.
+    Every pair is calculated once and acts on both agents with opposite signs (Newton's third law). Like the neighbor
+    cache of the agents, the list of pairs is kept between time steps: it contains all pairs within cutoff + skin and
+    is only rebuilt once an agent moved further than half the skin or new agents joined. Pairs of destroyed agents are
+    simply removed from it.
+    """
+    def __init__(self, epsilon: float=1e-6, cutoff: typing.Optional[float]=None, table_size: int=16384, skin: float=10.0):
+        """
+        Args:
+            epsilon (optional): The largest force of a single pair which may be neglected, defines the cutoff.
+            cutoff (optional): The cutoff distance, overrides epsilon.
+            table_size (optional): Number of intervals of the falloff table.
+            skin (optional): Additional distance of the pairs in the pair cache.
+        """
+        self.cutoff = cutoff if cutoff is not None else social_force_cutoff(epsilon)
+        self.skin = skin
+
+        # falloff over the squared distance, one extra entry for the interpolation at the upper end
+        self.scale = table_size / self.cutoff ** 2
+        squared_distance = np.arange(table_size + 2) / self.scale
+        self.table = social_force_factor(np.sqrt(squared_distance))
+
+        # pair cache
+        self.ids = None
+        self.reference = None
+        self.first = None
+        self.second = None
+
+    def reset_pair_cache(self, ids: typing.List[int], positions: np.ndarray):
+        """
+        Reset the pair cache.
+
+        Args:
+            ids: The ids of the agents.
+            positions: The positions of the agents, one row per agent.
+        """
+        self.ids = ids
+        self.reference = positions.copy()
+
+        first, second = np.triu_indices(len(positions), k=1)
+        difference = positions[first] - positions[second]
+        inside = np.einsum('ij,ij->i', difference, difference) < (self.cutoff + self.skin) ** 2
+        self.first = first[inside]
+        self.second = second[inside]
+
+    def remove_from_pair_cache(self, ids: typing.List[int]) -> bool:
+        """
+        Remove the pairs of agents which are gone from the pair cache, much cheaper than a reset.
+
+        Args:
+            ids: The ids of the remaining agents, in the same order as before.
+
+        Returns:
+            bool: False if the pair cache can't be kept, e.g. because new agents joined, and needs a reset.
+        """
+        if self.ids is None:
+            return False
+
+        index = {agent_id: k for k, agent_id in enumerate(ids)}
+        remap = np.array([index.get(agent_id, -1) for agent_id in self.ids], dtype=np.intp)
+        kept = remap >= 0
+        if not np.array_equal(remap[kept], np.arange(len(ids))):
+            return False
+
+        pairs = kept[self.first] & kept[self.second]
+        self.first = remap[self.first[pairs]]
+        self.second = remap[self.second[pairs]]
+        self.reference = self.reference[kept]
+        self.ids = ids
+        return True
+
+    def calculate(self, agents: typing.List[Agent]) -> np.ndarray:
+        """
+        Calculate the social force of all agents.
+
+        Args:
+            agents: All agents currently in the simulation.
+
+        Returns:
+            np.ndarray: One row per agent containing the force that pushes away from other agents, zero for dead agents.
+        """
+        alive = [k for k, a in enumerate(agents) if a.is_alive]
+        ids = [agents[k].id for k in alive]
+        positions = np.array([agents[k].position for k in alive], dtype=np.float64).reshape(-1, 3)
+
+        # destroyed agents are removed from the pair cache, new agents or large moves need a new one
+        if ids != self.ids and not self.remove_from_pair_cache(ids):
+            self.reset_pair_cache(ids, positions)
+        elif np.max(np.sum((positions - self.reference) ** 2, axis=1), initial=0) > (0.5 * self.skin) ** 2:
+            self.reset_pair_cache(ids, positions)
+
+        difference = positions[self.first] - positions[self.second]
+        squared_distance = np.einsum('ij,ij->i', difference, difference)
+
+        inside = squared_distance < self.cutoff ** 2
+        first = self.first[inside]
+        second = self.second[inside]
+        difference = difference[inside]
+
+        # linear interpolation in the falloff table
+        index = squared_distance[inside] * self.scale
+        lower = index.astype(np.intp)
+        fraction = index - lower
+        factor = self.table[lower] + fraction * (self.table[lower + 1] - self.table[lower])
+
+        pair_force = factor[:, np.newaxis] * difference
+        force = np.zeros((len(alive), 3), dtype=np.float64)
+        for axis in range(3):
+            force[:, axis] = np.bincount(first, pair_force[:, axis], minlength=len(alive)) \
+                - np.bincount(second, pair_force[:, axis], minlength=len(alive))
+
+        forces = np.zeros((len(agents), 3), dtype=np.float64)
+        forces[alive] = force
+        return forces
+
+class Termination():
+    """
+    Online criteria to end a simulation early, checked once per time step.
+
+    A check counts the ships of each team, which is linear in the number of agents and cheap compared to the
+    quadratic update of a time step. The run ends when a team has been wiped out or when the team sizes stayed
+    within tolerance over a sliding window, i.e. the remaining ships no longer destroy each other. The window only
+    starts once the team sizes changed for the first time, the fleets don't fight before they meet. Teams do not
+    grow, so there are no population cycles to detect.
+    """
+    def __init__(self, teams: int=2, window: int=1000, tolerance: float=0.01):
+        """
+        Args:
+            teams (optional): Number of teams, agents use their team as agent_type.
+            window (optional): Number of time steps in the sliding window.
+            tolerance (optional): Maximum standard deviation of the team sizes, relative to their mean.
+        """
+        self.window = window
+        self.tolerance = tolerance
+
+        # why and at which time step the simulation was stopped
+        self.reason = None
+        self.systemtime = None
+
+        # team sizes at the first check, the steady state is only checked once they changed
+        self.initial = None
+
+        # sliding window of team sizes with running sums for mean and variance
+        self.history = collections.deque()
+        self.sums = [0] * teams
+        self.squares = [0] * teams
+
+    def check(self, systemtime: int, agents: typing.List['Agent']) -> bool:
+        """
+        Check whether the simulation should be stopped, see reason and systemtime for why and when.
+
+        Args:
+            systemtime: The current time step of the simulation.
+            agents: All agents currently in the simulation.
+
+        Returns:
+            bool: True if the simulation should be stopped.
+        """
+        counts = [0] * len(self.sums)
+        for a in agents:
+            if a.is_alive:
+                counts[a.type] += 1
+
+        for team, n in enumerate(counts):
+            if n == 0:
+                return self.stop(systemtime, f"team {team} wiped out")
+
+        # no ship got destroyed yet, the fight hasn't started
+        if self.initial is None:
+            self.initial = counts
+        if counts == self.initial:
+            return False
+
+        self.history.append(counts)
+        for i, n in enumerate(counts):
+            self.sums[i] += n
+            self.squares[i] += n * n
+
+        if len(self.history) > self.window:
+            for i, n in enumerate(self.history.popleft()):
+                self.sums[i] -= n
+                self.squares[i] -= n * n
+
+        if len(self.history) < self.window:
+            return False
+
+        for i in range(len(counts)):
+            mean = self.sums[i] / self.window
+            variance = self.squares[i] / self.window - mean ** 2
+            if variance > (self.tolerance * mean) ** 2:
+                return False
+
+        return self.stop(systemtime, "steady state")
+
+    def stop(self, systemtime: int, reason: str) -> bool:
+        """
+        Record why and when the simulation was stopped.
+
+        Args:
+            systemtime: The current time step of the simulation.
+            reason: Why the simulation was stopped.
+
+        Returns:
+            bool: Always True
+        """
+        self.reason = reason
+        self.systemtime = systemtime
+        return True
+
+def propose_chunk(args: typing.Tuple[typing.List[Agent], typing.List[Agent], int, typing.List[typing.Tuple[float, float]],
+                                     typing.Optional[np.ndarray]]) -> typing.List[typing.Optional[Proposal]]:
+    """
+    Calculate the proposals of a chunk of agents, e.g. on a worker of a thread or process pool.
+
+    Args:
+        args: The agents of the chunk, all agents, the current time step, the random numbers of the chunk and
+              the social forces of the chunk (or None).
+
+    Returns:
+        typing.List[Proposal]: One proposal per agent of the chunk.
+    """
+    chunk, agents, systemtime, rolls, forces = args
+    if forces is None:
+        return [a.propose(systemtime, agents, r) for a, r in zip(chunk, rolls)]
+
+    return [a.propose(systemtime, agents, r, f_social=f) for a, r, f in zip(chunk, rolls, forces)]
+
+def update_two_phase(systemtime: int, agents: typing.List[Agent], output_file: typing.TextIO,
+                     executor: typing.Optional[concurrent.futures.Executor]=None, chunk_size: int=50,
+                     forces: typing.Optional[np.ndarray]=None):
+    """
+    Update all agents in two phases: all agents propose their actions first, then the proposals are committed.
+
+    The result only depends on the order of the agents, not on the executor used for the proposals.
+
+    Args:
+        systemtime: The current time step of the simulation.
+        agents: All agents currently in the simulation.
+        output_file: An open file descriptor which accepts the output of the simulation.
+        executor (optional): A thread or process pool to calculate the proposals in parallel.
+        chunk_size (optional): That many agents are sent to a worker at once.
+        forces (optional): The social force of every agent, calculated by SocialForce.
+    """
+    # draw all random numbers up front, in a fixed order
+    rolls = [(random.random(), random.random()) for _ in agents]
+
+    chunks = [(agents[i:i + chunk_size], agents, systemtime, rolls[i:i + chunk_size],
+               forces[i:i + chunk_size] if forces is not None else None) for i in range(0, len(agents), chunk_size)]
+    mapper = executor.map if executor else map
+    proposals = [p for chunk in mapper(propose_chunk, chunks) for p in chunk]
+
+    agents_by_id = {a.id: a for a in agents}
+    for a, p in zip(agents, proposals):
+        a.commit(systemtime, p, agents_by_id, output_file)
+
+def main(two_phase: bool=False, executor: typing.Optional[concurrent.futures.Executor]=None,
+         termination: typing.Optional[Termination]=None, steps: int=12500, agent_count: int=400,
+         observer: typing.Optional[typing.Callable[[int, typing.List[Agent]], None]]=None,
+         social_force: typing.Optional['SocialForce']=None, spread: float=1.0, energy: float=100,
+         output_file: typing.Optional[typing.TextIO]=None):
     # open and initialize the the ouput file
-    output_file = open('output.csv', 'w')
+    if output_file is None:
+        output_file = open('output.csv', 'w')
     print(0, ',', 'Title', ',', 'Simple Spaceship Simulation', file=output_file)
     print(0, ',', 'Scene', ',', 0, ',', 0, ',', 1280,  file=output_file)
 
@@ -241,27 +721,46 @@ def main():
     agents = []
     missiles = []
     agent_ids = 0
-    for i in range(400):
-        x = random.randint(-1000, -500) if i%2 == 0 else random.randint(500, 1000)
-        y = random.randint(-1000, 1000)
+    for i in range(agent_count):
+        # spread scales the horizontal distance of the fleets, small values make them meet early
+        x = random.randint(round(-1000 * spread), round(-500 * spread)) if i%2 == 0 else random.randint(round(500 * spread), round(1000 * spread))
+        y = random.randint(round(-1000 * spread), round(1000 * spread))
         z = random.randint( 250, 500)
-        agents.append(Agent(agent_id=agent_ids, agent_type=i%2, x=x, y=y, z=z))
+        agents.append(Agent(agent_id=agent_ids, agent_type=i%2, x=x, y=y, z=z, energy=energy))
         print(f"0, Agent, {agent_ids}, {i%2}", file=output_file)
         agent_ids = agent_ids + 1
 
-    for systemtime in range(12500):
+    for systemtime in range(steps):
         # move all agents to new position first, so all positions are known
         for a in agents:
             a.move(systemtime, output_file)
 
+        # the social force of the whole fleet at once, the positions don't change until the next move
+        forces = social_force.calculate(agents) if social_force else None
+
         # update all agents velocity and do other stuff like shooting
-        for a in agents:
-            a.update(systemtime, agents, output_file)
+        if two_phase:
+            update_two_phase(systemtime, agents, output_file, executor=executor, forces=forces)
+        elif forces is not None:
+            for a, f in zip(agents, forces):
+                a.update(systemtime, agents, output_file, f_social=f)
+        else:
+            for a in agents:
+                a.update(systemtime, agents, output_file)
 
         # handle dead agents (not too often)
         if systemtime % 100 == 0:
             agents = [a for a in agents if a.is_alive is True]
             missiles = [m for m in missiles if m.is_alive is True]
 
+        # let an observer look at the agents, e.g. golden.py
+        if observer:
+            observer(systemtime, agents)
+
+        # end the simulation early if a team is wiped out or nothing happens anymore
+        if termination and termination.check(systemtime, agents):
+            print(f"{systemtime}, Stop, {termination.reason}", file=output_file)
+            break
+
 if __name__ == "__main__":
     main()
@@ -3,6 +3,7 @@ python setup.py build_ext --inplace
 """
 
 import random
+import time
 
 from datetime import datetime
 random.seed(datetime.now().timestamp())
@@ -28,9 +29,9 @@ class Plant(Agent):
         self.vmax = 0
 
 
-def main():
+def main(steps=10000, observer=None, telemetry=None, output_file=None):
     # open the ouput file
-    f = open('output.csv', 'w')
+    f = output_file if output_file else open('output.csv', 'w')
     print(0, ',', 'Title', ',', 'Predator Prey Relationship / Example 02 / Cython', file=f)
 
     # create initial agents
@@ -39,7 +40,11 @@ def main():
     plants = [Plant(world_width=WORLD_WIDTH, world_height=WORLD_HEIGHT) for i in range(100)]
 
     timestep = 0
-    while timestep < 10000:
+    while timestep < steps:
+        if telemetry:
+            start = time.perf_counter_ns()
+            alive = len(plants) + len(preys) + len(predators)
+
         # update all agents
         #[f.update([]) for f in plants]  # no need to update the plants; they do not move
         [a.update(plants) for a in preys]
@@ -47,10 +52,12 @@ def main():
 
         # handle eaten and create new plant
         plants = [p for p in plants if p.is_alive is True]
+        survivors = len(plants)
         plants = plants + [Plant(world_width=WORLD_WIDTH, world_height=WORLD_HEIGHT) for i in range(2)]
 
         # handle eaten and create new preys
         preys = [p for p in preys if p.is_alive is True]
+        survivors = survivors + len(preys)
 
         for p in preys[:]:
             if p.energy > 5:
@@ -59,6 +66,7 @@ def main():
 
         # handle old and create new predators
         predators = [p for p in predators if p.age < 2000]
+        survivors = survivors + len(predators)
 
         for p in predators[:]:
             if p.energy > 10:
@@ -70,9 +78,22 @@ def main():
         #[print(timestep, ',', 'Position',  ',', 'Prey', ',', a.x, ',', a.y, file=f) for a in preys]
         #[print(timestep, ',', 'Position',  ',', 'Plant', ',', a.x, ',', a.y, file=f) for a in plants]
 
+        # record populations, births, deaths and the duration of the time step
+        if telemetry:
+            born = len(plants) + len(preys) + len(predators) - survivors
+            telemetry.record(timestep, len(plants), len(preys), len(predators), born, alive - survivors,
+                             time.perf_counter_ns() - start)
+
+        # let an observer look at the agents, e.g. golden.py
+        if observer:
+            observer(timestep, predators, preys, plants)
+
         timestep = timestep + 1
 
     print(len(predators), len(preys), len(plants))
 
+    if telemetry:
+        telemetry.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,247 @@
+"""
+Golden-trajectory regression harness (c) 2023 Multi-Agent AI
+
+Records a seeded reference run as compact per-step fingerprints and compares other engines against it:
+
+python golden.py record example_02 -f golden.json
+python golden.py compare example_02_cython -f golden.json
+python golden.py record spacesim -f golden_spacesim.json
+python golden.py compare spacesim -f golden_spacesim.json
+
+Each step is fingerprinted with a hash of the kinematic state (positions, velocities, ...), a hash of the
+discrete state (alive, age, energy, targets, ...) and of the event lines the simulation writes to its output
+(shots, explosions, ...), the number of agents and the sums and sums of squares of all kinematic values. In
+exact mode both hashes have to match. In tolerance mode the discrete hash and the number of agents have to match
+and the sums have to be within the tolerance.
+
+The fleets of spacesim are spawned close to each other and with little energy, so that they start shooting after
+about 50 time steps and the first ship explodes after about 80.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import sys
+import typing
+
+import click
+
+ENGINE_NAMES = ['example_02', 'example_02:two_phase', 'example_02_cython', 'spacesim', 'spacesim:two_phase',
+                'spacesim:social_force']
+
+# spawn settings of spacesim, the fleets meet early and ships explode after a few hits
+SPACESIM_SPREAD = 0.05
+SPACESIM_ENERGY = 5
+
+
+def predator_prey_agent(a) -> typing.Tuple[typing.Tuple[float, ...], typing.Tuple[float, ...]]:
+    """ Kinematic and discrete state of an agent of example_02 or example_02_cython. """
+    return (a.x, a.y), (a.is_alive, a.age, a.energy)
+
+
+def spacesim_agent(a) -> typing.Tuple[typing.Tuple[float, ...], typing.Tuple[float, ...]]:
+    """ Kinematic and discrete state of an agent of spacesim. """
+    kinematics = (*a.position, *a.velocity, *a.force)
+    discrete = (a.id, a.type, a.is_alive, a.energy, a.target.id if a.target else -1, a.targeted)
+    return kinematics, discrete
+
+
+class EventLog():
+    """
+    Output file of a simulation, collects the event lines. Positions are part of the kinematic state and titles
+    differ between engines, both are skipped.
+    """
+
+    def __init__(self):
+        self.pending = ''
+        self.lines = []
+
+    def write(self, text: str) -> int:
+        self.pending += text
+        if '\n' in self.pending:
+            *lines, self.pending = self.pending.split('\n')
+            self.lines.extend(line for line in lines if line.split(',')[1:2] not in ([' Position'], [' Title ']))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        """ Return and forget the event lines written so far. """
+        lines, self.lines = self.lines, []
+        return '\n'.join(lines).encode()
+
+
+class Recorder():
+    """ Observer for the main() functions of the simulations, stores one fingerprint per step. """
+
+    def __init__(self, describe: typing.Callable):
+        """
+        Args:
+            describe: Returns the kinematic and discrete state of an agent.
+        """
+        self.describe = describe
+        self.records = []
+        self.log = EventLog()
+
+    def __call__(self, step: int, *groups: typing.List):
+        state = hashlib.blake2b(digest_size=8)
+        events = hashlib.blake2b(digest_size=8)
+        events.update(self.log.take())
+        count = 0
+        sums = None
+
+        for agents in groups:
+            for a in agents:
+                kinematics, discrete = self.describe(a)
+                state.update(struct.pack(f'<{len(kinematics)}d', *kinematics))
+                events.update(struct.pack(f'<{len(discrete)}d', *discrete))
+                if sums is None:
+                    sums = [0.0] * (2 * len(kinematics))
+                for i, v in enumerate(kinematics):
+                    sums[2 * i] += v
+                    sums[2 * i + 1] += v * v
+                count += 1
+
+            # mark the end of a group, so moving an agent between groups changes the hash
+            events.update(b'|')
+
+        self.records.append([step, state.hexdigest(), events.hexdigest(), count, sums or []])
+
+
+def run(engine: str, seed: int, steps: int, agent_count: int) -> typing.List[list]:
+    """
+    Run a simulation engine with a fixed seed and return its fingerprints.
+
+    Args:
+        engine: One of ENGINE_NAMES, an optional ':two_phase' selects the two-phase update and ':social_force'
+                the batched social force.
+        seed: Seed of the random number generator.
+        steps: Number of time steps to simulate.
+        agent_count: Number of ships, only used by spacesim.
+
+    Returns:
+        typing.List[list]: One fingerprint per step.
+    """
+    name, _, variant = engine.partition(':')
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    sys.path.insert(0, os.path.join(here, '2023-space-movie'))
+
+    if name == 'example_02':
+        import example_02 as module
+        recorder = Recorder(predator_prey_agent)
+        kwargs = dict(two_phase=variant == 'two_phase')
+    elif name == 'example_02_cython':
+        import example_02_cython as module
+        recorder = Recorder(predator_prey_agent)
+        kwargs = dict()
+    elif name == 'spacesim':
+        import spacesim as module
+        recorder = Recorder(spacesim_agent)
+        kwargs = dict(two_phase=variant == 'two_phase', agent_count=agent_count, spread=SPACESIM_SPREAD,
+                      energy=SPACESIM_ENERGY)
+        if variant == 'social_force':
+            kwargs['social_force'] = module.SocialForce()
+    else:
+        raise click.BadParameter(f"unknown engine {engine}, use one of {', '.join(ENGINE_NAMES)}")
+
+    random.seed(seed)
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            module.main(steps=steps, observer=recorder, output_file=recorder.log, **kwargs)
+        finally:
+            sys.stdout = stdout
+
+    return recorder.records
+
+
+def first_divergence(reference: typing.List[list], candidate: typing.List[list],
+                     tolerance: typing.Optional[float]=None) -> typing.Optional[typing.Tuple[int, str]]:
+    """
+    Find the first step in which two runs differ.
+
+    Args:
+        reference: Fingerprints of the reference run.
+        candidate: Fingerprints of the run to check.
+        tolerance (optional): Relative and absolute tolerance for the kinematic sums, None for exact mode.
+
+    Returns:
+        typing.Tuple[int, str]: The step and a description of the difference, None if both runs match.
+    """
+    for r, c in zip(reference, candidate):
+        step, state, events, count, sums = r
+        if c[0] != step:
+            return step, f"step {c[0]} instead of {step}"
+        if c[3] != count:
+            return step, f"{c[3]} agents instead of {count}"
+        if c[2] != events:
+            return step, "discrete state or events differ (births, deaths, energy, targets, shots)"
+        if tolerance is None:
+            if c[1] != state:
+                return step, "kinematic state differs"
+        else:
+            for i, (a, b) in enumerate(zip(sums, c[4])):
+                if not math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance):
+                    kind = 'sum of squares' if i % 2 else 'sum'
+                    return step, f"{kind} of kinematic value {i // 2} is {b} instead of {a}"
+
+    if len(reference) != len(candidate):
+        step = min(len(reference), len(candidate))
+        return step, f"{len(candidate)} steps instead of {len(reference)}"
+
+    return None
+
+
+@click.group(help="Records and compares seeded reference runs of the simulations.")
+def cli():
+    pass
+
+
+@cli.command(help="Records the fingerprints of a reference run.")
+@click.argument('engine')
+@click.option('--filename', '-f', default='golden.json', help="The file to write the fingerprints to.")
+@click.option('--seed', '-s', default=42, help="Seed of the random number generator.")
+@click.option('--steps', '-n', default=500, help="Number of time steps to simulate.")
+@click.option('--agents', '-a', 'agent_count', default=40, help="Number of ships, spacesim only.")
+def record(engine: str, filename: str, seed: int, steps: int, agent_count: int):
+    records = run(engine, seed, steps, agent_count)
+    with open(filename, 'w') as f:
+        json.dump(dict(engine=engine, seed=seed, steps=steps, agents=agent_count, records=records), f)
+    print(f"recorded {len(records)} steps of {engine} to {filename}")
+
+
+@cli.command(help="Compares an engine against a recorded or a freshly run reference.")
+@click.argument('engine')
+@click.option('--filename', '-f', default='golden.json', help="The file with the reference fingerprints.")
+@click.option('--reference', '-r', default=None, help="Run this engine as reference instead of reading a file.")
+@click.option('--seed', '-s', default=42, help="Seed of the random number generator, with --reference only.")
+@click.option('--steps', '-n', default=500, help="Number of time steps to simulate, with --reference only.")
+@click.option('--agents', '-a', 'agent_count', default=40, help="Number of ships, with --reference only.")
+@click.option('--tolerance', '-t', default=None, type=float, help="Compare kinematics within this tolerance.")
+def compare(engine: str, filename: str, reference: typing.Optional[str], seed: int, steps: int, agent_count: int,
+            tolerance: typing.Optional[float]):
+    if reference:
+        expected = run(reference, seed, steps, agent_count)
+    else:
+        with open(filename) as f:
+            golden = json.load(f)
+        reference = golden['engine']
+        seed, steps, agent_count = golden['seed'], golden['steps'], golden['agents']
+        expected = golden['records']
+
+    divergence = first_divergence(expected, run(engine, seed, steps, agent_count), tolerance)
+    if divergence:
+        step, reason = divergence
+        print(f"{engine} diverges from {reference} at step {step}: {reason}")
+        sys.exit(1)
+
+    mode = 'exact' if tolerance is None else f'tolerance {tolerance}'
+    print(f"{engine} matches {reference} for {steps} steps ({mode})")
+
+
+if __name__ == "__main__":
+    cli()
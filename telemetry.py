@@ -0,0 +1,188 @@
+"""
+Population and step-latency telemetry for the predator prey examples (c) 2023 Multi-Agent AI
+
+The simulation writes one fixed-size record per time step into a preallocated ring buffer in shared memory,
+which costs a single struct.pack_into per step. Another process can read it while the simulation is running:
+
+python telemetry.py <shared memory name>
+
+At exit the buffer is dumped into a compact binary file, which can be printed the same way:
+
+python telemetry.py telemetry.bin
+"""
+import atexit
+import os
+import struct
+import typing
+from multiprocessing import resource_tracker, shared_memory
+
+import click
+
+# magic, capacity, size of a record, number of records written so far
+HEADER = struct.Struct('<4sIIq')
+COUNT = struct.Struct('<q')
+COUNT_OFFSET = 12
+
+# step, plants, preys, predators, births, deaths, step latency in nanoseconds
+RECORD = struct.Struct('<q5Iq')
+FIELDS = ('step', 'plants', 'preys', 'predators', 'births', 'deaths', 'latency_ns')
+
+MAGIC = b'PPT1'
+
+# names of the shared memory blocks created by this process
+OWNED = set()
+
+
+class Telemetry():
+    """ Writes the telemetry of a simulation into a ring buffer in shared memory. """
+
+    def __init__(self, capacity: int=65536, name: typing.Optional[str]=None, filename: typing.Optional[str]='telemetry.bin'):
+        """
+        Args:
+            capacity (optional): Number of time steps kept in the ring buffer.
+            name (optional): Name of the shared memory block, a random name is chosen by default.
+            filename (optional): The buffer is dumped into this file at exit, None to skip the dump.
+        """
+        self.capacity = capacity
+        self.filename = filename
+        self.written = 0
+
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + capacity * RECORD.size)
+        self.name = self.shm.name
+        OWNED.add(self.name)
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, capacity, RECORD.size, 0)
+
+        atexit.register(self.close)
+
+    def record(self, step: int, plants: int, preys: int, predators: int, births: int, deaths: int, latency_ns: int):
+        """
+        Record the telemetry of one time step.
+
+        Args:
+            step: The current time step of the simulation.
+            plants: Number of plants at the end of the time step.
+            preys: Number of preys at the end of the time step.
+            predators: Number of predators at the end of the time step.
+            births: Number of agents created during the time step.
+            deaths: Number of agents which were eaten or died of old age during the time step.
+            latency_ns: Duration of the time step in nanoseconds.
+        """
+        offset = HEADER.size + (self.written % self.capacity) * RECORD.size
+        RECORD.pack_into(self.shm.buf, offset, step, plants, preys, predators, births, deaths, latency_ns)
+
+        # publish the record only after it has been written completely
+        self.written += 1
+        COUNT.pack_into(self.shm.buf, COUNT_OFFSET, self.written)
+
+    def close(self):
+        """ Dump the ring buffer into the file, if any, and release the shared memory. Can be called repeatedly. """
+        if self.shm is None:
+            return
+
+        if self.filename:
+            with open(self.filename, 'wb') as f:
+                f.write(dump(bytes(self.shm.buf), self.written))
+
+        self.shm.close()
+        self.shm.unlink()
+        OWNED.discard(self.name)
+        self.shm = None
+        atexit.unregister(self.close)
+
+
+def dump(buffer: bytes, written: int) -> bytes:
+    """
+    Put the records of a ring buffer in chronological order, behind a header.
+
+    Args:
+        buffer: The content of the shared memory block.
+        written: Number of records written into the ring buffer so far.
+
+    Returns:
+        bytes: The header followed by the records, the format of the dump files.
+    """
+    _, capacity, _, _ = HEADER.unpack_from(buffer, 0)
+    data = buffer[HEADER.size:HEADER.size + capacity * RECORD.size]
+
+    # the oldest record is the next one to be overwritten
+    if written > capacity:
+        split = (written % capacity) * RECORD.size
+        data = data[split:] + data[:split]
+    count = min(written, capacity)
+
+    return HEADER.pack(MAGIC, count, RECORD.size, count) + data[:count * RECORD.size]
+
+
+def parse(data: bytes) -> typing.List[tuple]:
+    """
+    Parse the records of a dump.
+
+    Args:
+        data: Content of a dump file, see dump().
+
+    Returns:
+        typing.List[tuple]: One tuple per time step in chronological order, see FIELDS.
+    """
+    magic, _, size, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError("not a telemetry dump")
+
+    return list(RECORD.iter_unpack(data[HEADER.size:HEADER.size + count * RECORD.size]))
+
+
+def read(name: str) -> typing.List[tuple]:
+    """
+    Read the records of a running simulation from shared memory.
+
+    Records which were overwritten while they were copied are left out. This includes the slot the writer fills
+    next: a record is written before it is published, so that slot may already hold a newer, possibly half written
+    record.
+
+    Args:
+        name: Name of the shared memory block, see Telemetry.name.
+
+    Returns:
+        typing.List[tuple]: One tuple per time step in chronological order, see FIELDS.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # a simulation in another process owns the block, don't let the resource tracker of this process remove
+        # it at exit; the tracker of the simulation's own process must keep it
+        if name not in OWNED and os.name == 'posix':
+            resource_tracker.unregister('/' + shm.name, 'shared_memory')
+
+    try:
+        before = COUNT.unpack_from(shm.buf, COUNT_OFFSET)[0]
+        buffer = bytes(shm.buf)
+        after = COUNT.unpack_from(shm.buf, COUNT_OFFSET)[0]
+    finally:
+        shm.close()
+
+    records = parse(dump(buffer, before))
+
+    # the writer went on while copying, the oldest records may have been overwritten, and the next record
+    # (index after) may already be in progress in the slot of the oldest one
+    capacity = HEADER.unpack_from(buffer, 0)[1]
+    overwritten = (after + 1 - capacity) - (before - len(records))
+    return records[max(0, overwritten):]
+
+
+@click.command(help="Prints the telemetry of a running simulation or of a dump file as CSV.")
+@click.argument('source')
+@click.option('--last', '-n', default=0, help="Print only the last n time steps.")
+def main(source: str, last: int):
+    if os.path.isfile(source):
+        with open(source, 'rb') as f:
+            records = parse(f.read())
+    else:
+        records = read(source)
+
+    print(', '.join(FIELDS))
+    for r in records[-last:] if last else records:
+        print(', '.join(str(v) for v in r))
+
+
+if __name__ == "__main__":
+    main()